@@ -11,6 +11,7 @@ from routes.upload import upload_bp
 from routes.predict import predict_bp
 from routes.plan import plan_bp
 from routes.products import products_bp 
+from utils.serialization import OrjsonProvider
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +20,7 @@ logger = logging.getLogger(__name__)
 def create_app():
     """Create and configure Flask application."""
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
     
     # Enable CORS for React frontend
     CORS(app, origins=['http://localhost:3000', 'http://localhost:3001'])
@@ -55,5 +57,6 @@ def create_app():
     return app
 
 if __name__ == '__main__':
+    # Development server only; use wsgi.py with gunicorn for production
     app = create_app()
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,31 +1,12 @@
 # server/routes/plan.py
 from flask import Blueprint, request, jsonify
 import logging
-import numpy as np
-from typing import Any, Dict, List, Union
+from utils.serialization import to_json_response
 from utils.optimizer import StockOptimizer
 
 plan_bp = Blueprint('plan', __name__)
 logger = logging.getLogger(__name__)
 
-def make_json_serializable(obj: Any) -> Any:
-    """Convert NumPy types to Python native types."""
-    if isinstance(obj, (np.float32, np.float64)):
-        return round(float(obj), 2)
-    if isinstance(obj, float):
-        return round(obj, 2)
-    if isinstance(obj, (np.int32, np.int64)):
-        return int(obj)
-    if isinstance(obj, int):
-        return obj
-    if isinstance(obj, np.ndarray):
-        return [make_json_serializable(i) for i in obj]
-    if isinstance(obj, (list, tuple)):
-        return [make_json_serializable(i) for i in obj]
-    if isinstance(obj, dict):
-        return {k: make_json_serializable(v) for k, v in obj.items()}
-    return obj
-
 @plan_bp.route('/plan', methods=['POST'])
 def create_stock_plan():
     """Create optimized stock plan considering shelf life constraints."""
@@ -35,37 +16,39 @@ def create_stock_plan():
         # Get parameters from request
         product_ids = data.get('product_ids', None)  # None means use all products
         planning_horizon = data.get('planning_horizon', 7)
+        include_recommendations = data.get('include_recommendations', True)
         
         if product_ids is not None:
             if not isinstance(product_ids, list) or len(product_ids) == 0:
                 return jsonify({"error": "Product IDs must be a non-empty list"}), 400
 
+        if not isinstance(planning_horizon, int) or isinstance(planning_horizon, bool) or planning_horizon < 0:
+            return jsonify({"error": "Planning horizon must be a non-negative integer"}), 400
+
+        if not isinstance(include_recommendations, bool):
+            return jsonify({"error": "include_recommendations must be a boolean"}), 400
+
         # Initialize optimizer
         optimizer = StockOptimizer()
         
         # Create optimized stock plan
-        stock_plan_result = optimizer.optimize_stock_plan(product_ids, planning_horizon)
+        stock_plan_result = optimizer.optimize_stock_plan(
+            product_ids, planning_horizon, include_recommendations=include_recommendations
+        )
 
         # Check if result is a dictionary and has the expected structure
         if not isinstance(stock_plan_result, dict) or not stock_plan_result.get('stock_plan'):
             return jsonify({"error": "No stock plan could be generated. Check if data files are uploaded."}), 500
 
-        # Convert NumPy types to JSON-serializable format
-        stock_plan_serializable = make_json_serializable(stock_plan_result)
-        
-        # Safely access dictionary values with type checking
-        stock_plan = stock_plan_serializable.get('stock_plan', []) if isinstance(stock_plan_serializable, dict) else []
-        summary = stock_plan_serializable.get('summary', {}) if isinstance(stock_plan_serializable, dict) else {}
-        horizon = stock_plan_serializable.get('planning_horizon', f"{planning_horizon} days") if isinstance(stock_plan_serializable, dict) else f"{planning_horizon} days"
-        total_products = stock_plan_serializable.get('total_products', 0) if isinstance(stock_plan_serializable, dict) else 0
-        
-        return jsonify({
+        # Result is known to be a dict at this point
+        payload = {
             "message": "Stock plan created successfully",
-            "stock_plan": stock_plan,
-            "summary": summary,
-            "planning_horizon": horizon,
-            "total_products": total_products
-        }), 200
+            "stock_plan": stock_plan_result['stock_plan'],
+            "summary": stock_plan_result.get('summary', {}),
+            "planning_horizon": stock_plan_result.get('planning_horizon', f"{planning_horizon} days"),
+            "total_products": stock_plan_result.get('total_products', 0)
+        }
+        return to_json_response(payload), 200
 
     except FileNotFoundError as e:
         logger.error(f"Required files not found: {str(e)}")
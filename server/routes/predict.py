@@ -1,32 +1,16 @@
 # server/routes/predict.py
 from flask import Blueprint, request, jsonify
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
 import logging
-from typing import Any, Dict, List, Union
+from utils.serialization import to_json_response
 from utils.forecast import DemandForecaster
+from utils.data_loader import load_product_lookup
 
 predict_bp = Blueprint('predict', __name__)
 logger = logging.getLogger(__name__)
 
-def make_json_serializable(obj: Any) -> Any:
-    """Convert NumPy types to native Python types with rounding where applicable."""
-    if isinstance(obj, (np.float32, np.float64)):
-        return round(float(obj), 2)
-    if isinstance(obj, float):
-        return round(obj, 2)
-    if isinstance(obj, (np.int32, np.int64)):
-        return int(obj)
-    if isinstance(obj, int):
-        return obj
-    if isinstance(obj, np.ndarray):
-        return [make_json_serializable(i) for i in obj]
-    if isinstance(obj, (list, tuple)):
-        return [make_json_serializable(i) for i in obj]
-    if isinstance(obj, dict):
-        return {k: make_json_serializable(v) for k, v in obj.items()}
-    return obj
+def _get_first_product_ids(n=10):
+    """Return the first n product IDs, in file order, from the cached products data."""
+    return list(load_product_lookup('data/products.csv'))[:n]
 
 @predict_bp.route('/predict', methods=['POST'])
 def predict_demand():
@@ -38,11 +22,13 @@ def predict_demand():
         product_ids = data.get('product_ids', [])
         days_ahead = data.get('days_ahead', 7)
 
+        if not isinstance(days_ahead, int) or isinstance(days_ahead, bool) or days_ahead < 0:
+            return jsonify({"error": "Days ahead must be a non-negative integer"}), 400
+
         # If no product_ids provided, get some from products file
         if not product_ids:
             try:
-                products_df = pd.read_csv('data/products.csv')
-                product_ids = products_df['product_id'].unique()[:10].tolist()  # Get first 10
+                product_ids = _get_first_product_ids()  # Get first 10
             except:
                 return jsonify({"error": "No product IDs provided and couldn't load products data"}), 400
 
@@ -52,24 +38,19 @@ def predict_demand():
         # Initialize forecaster
         forecaster = DemandForecaster()
 
-        # Load model and make predictions
+        # Load model and predict every requested product in one batch
         predictions = forecaster.predict_demand(product_ids, days_ahead)
 
         if not predictions:
             return jsonify({"error": "No predictions could be generated. Check if data files are uploaded."}), 500
 
-        # Convert predictions to JSON-serializable types
-        serializable_predictions = {}
-        if isinstance(predictions, dict):
-            for pid, preds in predictions.items():
-                serializable_predictions[pid] = make_json_serializable(preds)
-
-        return jsonify({
+        payload = {
             "message": "Demand prediction completed",
             "forecast_period": f"{days_ahead} days",
-            "predictions": serializable_predictions,
-            "total_products": len(serializable_predictions)
-        }), 200
+            "predictions": predictions,
+            "total_products": len(predictions)
+        }
+        return to_json_response(payload), 200
 
     except FileNotFoundError as e:
         logger.error(f"Required files not found: {str(e)}")
@@ -2,62 +2,108 @@
 Products route blueprint for retrieving product information.
 """
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, current_app
 import pandas as pd
 import logging
 import os
+import threading
+from utils.serialization import json_dumps
+from utils.data_loader import read_csv
 
 products_bp = Blueprint('products', __name__)
 logger = logging.getLogger(__name__)
 
+PRODUCTS_FILE_PATH = 'data/products.csv'
+
+# Accepted names for the product ID column, in order of preference
+PRODUCT_ID_COLUMNS = ('product_id', 'Product_ID', 'ProductID', 'product', 'Product', 'id', 'ID')
+
+# Parsed products file, keyed on (mtime, size) so an upload invalidates it
+_products_cache = {}
+_products_cache_lock = threading.Lock()
+
+def load_products():
+    """Load products.csv, re-parsing it only when the file on disk has changed."""
+    global _products_cache
+    stat = os.stat(PRODUCTS_FILE_PATH)
+    key = (stat.st_mtime_ns, stat.st_size)
+    
+    with _products_cache_lock:
+        if _products_cache.get('key') == key:
+            return _products_cache
+        
+        df = read_csv(PRODUCTS_FILE_PATH)
+        logger.info(f"Loaded products data with columns: {list(df.columns)}")
+        
+        # Resolve the product ID column once per file version
+        columns = set(df.columns)
+        product_column = next((col for col in PRODUCT_ID_COLUMNS if col in columns), None)
+        
+        unique_products = []
+        product_ids = None
+        products_by_id = None
+        if product_column:
+            # Categorical IDs hash each distinct value once; lookups then compare integer codes
+            product_ids = df[product_column].astype('category')
+            
+            # Index rows by product ID for O(1) lookups when IDs are unique
+            if product_ids.is_unique:
+                products_by_id = df.set_index(pd.CategoricalIndex(product_ids), drop=False)
+            
+            # Categories are the distinct non-NaN IDs; as strings, sorted for better UX
+            unique_products = sorted(product_ids.cat.categories.astype(str).unique().tolist())
+            logger.info(f"Found {len(unique_products)} unique products")
+        
+        # Pre-serialize the product list response, which only changes with the file
+        products_json = json_dumps({
+            "message": "Products retrieved successfully",
+            "products": unique_products,
+            "total_count": len(unique_products),
+            "source": "products.csv"
+        })
+        
+        _products_cache = {
+            'key': key,
+            'df': df,
+            'product_column': product_column,
+            'unique_products': unique_products,
+            'product_ids': product_ids,
+            'products_by_id': products_by_id,
+            'products_json': products_json
+        }
+        return _products_cache
+
 @products_bp.route('/products', methods=['GET'])
 def get_available_products():
     """Get list of all available products from the products.csv file."""
     try:
-        # Path to products.csv file
-        products_file_path = 'data/products.csv'
-        
-        if not os.path.exists(products_file_path):
-            logger.error(f"Products file not found at {products_file_path}")
+        if not os.path.exists(PRODUCTS_FILE_PATH):
+            logger.error(f"Products file not found at {PRODUCTS_FILE_PATH}")
             return jsonify({"error": "Products data file not found. Please upload the products.csv file first."}), 404
 
-        # Read the products dataset
-        df = pd.read_csv(products_file_path)
-        logger.info(f"Loaded products data with columns: {list(df.columns)}")
-        
-        # Check for product_id column (adjust based on your actual column name)
-        product_column = None
-        possible_columns = ['product_id', 'Product_ID', 'ProductID', 'product', 'Product', 'id', 'ID']
-        
-        for col in possible_columns:
-            if col in df.columns:
-                product_column = col
-                break
+        # Read the products dataset (cached between requests)
+        products = load_products()
+        df = products['df']
         
-        if not product_column:
+        if not products['product_column']:
             logger.error(f"No product ID column found. Available columns: {list(df.columns)}")
             return jsonify({
                 "error": "Product ID column not found in products.csv", 
                 "available_columns": list(df.columns)
             }), 500
 
-        # Get unique product IDs
-        unique_products = df[product_column].unique().tolist()
-        
-        # Remove any NaN values and convert to string
-        unique_products = [str(prod) for prod in unique_products if pd.notna(prod)]
-        
-        # Sort the products for better UX
-        unique_products.sort()
-        
-        logger.info(f"Found {len(unique_products)} unique products")
-        
-        return jsonify({
-            "message": "Products retrieved successfully",
-            "products": unique_products,
-            "total_count": len(unique_products),
-            "source": "products.csv"
-        }), 200
+        # The product list only changes with the file, so its version doubles as an ETag
+        mtime_ns, size = products['key']
+        etag = f"{mtime_ns}-{size}"
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        response = current_app.response_class(products['products_json'], mimetype='application/json')
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
 
     except Exception as e:
         logger.error(f"Error retrieving products: {str(e)}")
@@ -68,39 +114,32 @@ def get_available_products():
 def get_product_info(product_id):
     """Get detailed information about a specific product."""
     try:
-        products_file_path = 'data/products.csv'
-        
-        if not os.path.exists(products_file_path):
+        if not os.path.exists(PRODUCTS_FILE_PATH):
             return jsonify({"error": "Products data file not found."}), 404
 
-        # Read the products dataset
-        df = pd.read_csv(products_file_path)
-        
-        # Find product_id column
-        product_column = None
-        possible_columns = ['product_id', 'Product_ID', 'ProductID', 'product', 'Product', 'id', 'ID']
-        
-        for col in possible_columns:
-            if col in df.columns:
-                product_column = col
-                break
+        # Read the products dataset (cached between requests)
+        products = load_products()
+        df = products['df']
+        product_column = products['product_column']
         
         if not product_column:
             return jsonify({"error": "Product ID column not found"}), 500
 
         # Find the specific product
-        product_data = df[df[product_column] == product_id]
-        
-        if product_data.empty:
-            return jsonify({"error": f"Product {product_id} not found"}), 404
-        
-        # Convert to dictionary and make JSON serializable
-        product_info = product_data.iloc[0].to_dict()
-        
-        # Convert any NaN values to None
-        for key, value in product_info.items():
-            if pd.isna(value):
-                product_info[key] = None
+        products_by_id = products['products_by_id']
+        if products_by_id is not None:
+            if product_id not in products_by_id.index:
+                return jsonify({"error": f"Product {product_id} not found"}), 404
+            product_row = products_by_id.loc[product_id]
+        else:
+            product_data = df[products['product_ids'] == product_id]
+            if product_data.empty:
+                return jsonify({"error": f"Product {product_id} not found"}), 404
+            product_row = product_data.iloc[0]
+        
+        # Convert to dictionary, mapping NaN values to None in a single pass
+        product_row = product_row.astype(object)
+        product_info = product_row.where(product_row.notna(), None).to_dict()
         
         return jsonify({
             "message": "Product information retrieved successfully",
@@ -112,31 +151,40 @@ def get_product_info(product_id):
         return jsonify({"error": f"Failed to retrieve product info: {str(e)}"}), 500
 
 
+def _product_stats(products):
+    """Compute statistics for one version of products.csv, memoized on its cache entry."""
+    # The entry is replaced whenever the file changes, so its stats always match its df
+    stats = products.get('stats')
+    if stats is not None:
+        return stats
+    df = products['df']
+    
+    # Get basic statistics
+    stats = {
+        "total_products": len(df),
+        "columns": list(df.columns),
+        "data_types": {col: str(dtype) for col, dtype in df.dtypes.items()},
+        "missing_values": df.isnull().sum().to_dict()
+    }
+    
+    # If there's a category column, get category distribution
+    category_columns = ['category', 'Category', 'CATEGORY', 'product_category']
+    for col in category_columns:
+        if col in df.columns:
+            stats["category_distribution"] = df[col].value_counts().to_dict()
+            break
+    
+    return products.setdefault('stats', stats)
+
+
 @products_bp.route('/products/stats', methods=['GET'])
 def get_product_stats():
     """Get statistics about the products dataset."""
     try:
-        products_file_path = 'data/products.csv'
-        
-        if not os.path.exists(products_file_path):
+        if not os.path.exists(PRODUCTS_FILE_PATH):
             return jsonify({"error": "Products data file not found."}), 404
 
-        df = pd.read_csv(products_file_path)
-        
-        # Get basic statistics
-        stats = {
-            "total_products": len(df),
-            "columns": list(df.columns),
-            "data_types": {col: str(dtype) for col, dtype in df.dtypes.items()},
-            "missing_values": df.isnull().sum().to_dict()
-        }
-        
-        # If there's a category column, get category distribution
-        category_columns = ['category', 'Category', 'CATEGORY', 'product_category']
-        for col in category_columns:
-            if col in df.columns:
-                stats["category_distribution"] = df[col].value_counts().to_dict()
-                break
+        stats = _product_stats(load_products())
         
         return jsonify({
             "message": "Product statistics retrieved successfully",
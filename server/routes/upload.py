@@ -6,6 +6,7 @@ Handles CSV file validation and storage.
 from flask import Blueprint, request, jsonify, current_app
 import pandas as pd
 import os
+import tempfile
 import logging
 
 upload_bp = Blueprint('upload', __name__)
@@ -13,27 +14,45 @@ logger = logging.getLogger(__name__)
 
 ALLOWED_EXTENSIONS = {'csv'}
 
+REQUIRED_COLUMNS = {
+    'sales': frozenset({'date', 'product_id', 'quantity_sold', 'day_of_week', 'promotion'}),
+    'products': frozenset({'product_id', 'product_name', 'shelf_life_days', 'category'}),
+    'weather': frozenset({'date', 'temperature', 'humidity', 'precipitation'})
+}
+
 def allowed_file(filename):
     """Check if file extension is allowed."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def validate_csv_structure(df, file_type):
     """Validate CSV structure based on file type."""
-    required_columns = {
-        'sales': ['date', 'product_id', 'quantity_sold', 'day_of_week', 'promotion'],
-        'products': ['product_id', 'product_name', 'shelf_life_days', 'category'],
-        'weather': ['date', 'temperature', 'humidity', 'precipitation']
-    }
-    
-    if file_type not in required_columns:
+    required_columns = REQUIRED_COLUMNS.get(file_type)
+    if required_columns is None:
         return False, f"Unknown file type: {file_type}"
     
-    missing_cols = set(required_columns[file_type]) - set(df.columns)
+    missing_cols = required_columns.difference(df.columns)
     if missing_cols:
-        return False, f"Missing required columns: {missing_cols}"
+        return False, f"Missing required columns: {set(missing_cols)}"
     
     return True, "Valid structure"
 
+def count_csv_rows(filepath, chunk_size=1024 * 1024):
+    """Count data rows in a CSV file by scanning for newlines instead of parsing it."""
+    lines = 0
+    last_byte = b'\n'
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+    
+    # Count a final line without a trailing newline, then exclude the header
+    if last_byte != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
 @upload_bp.route('/upload', methods=['POST'])
 def upload_files():
     """Upload and validate CSV files for sales, products, and weather data."""
@@ -52,31 +71,41 @@ def upload_files():
             if not allowed_file(file.filename):
                 return jsonify({"error": f"Invalid file type for {file_type}. Only CSV files allowed."}), 400
             
+            filename = f"{file_type}.csv"
+            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            # Each request streams to its own temp file next to the target, so concurrent
+            # uploads never share one and existing data survives a bad file
+            fd, temp_path = tempfile.mkstemp(dir=current_app.config['UPLOAD_FOLDER'], suffix='.upload')
+            
             try:
-                # Read and validate CSV
-                df = pd.read_csv(file.stream)
+                with os.fdopen(fd, 'wb') as temp_file:
+                    file.save(temp_file)
+                # mkstemp creates the file owner-only; keep the usual data file permissions
+                os.chmod(temp_path, 0o644)
                 
-                # Validate structure
-                is_valid, message = validate_csv_structure(df, file_type)
+                # Validate structure from the header row only
+                header_df = pd.read_csv(temp_path, nrows=0)
+                is_valid, message = validate_csv_structure(header_df, file_type)
                 if not is_valid:
                     return jsonify({"error": f"Invalid {file_type} file structure: {message}"}), 400
                 
-                # Save file
-                filename = f"{file_type}.csv"
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                df.to_csv(filepath, index=False)
+                rows = count_csv_rows(temp_path)
+                os.replace(temp_path, filepath)
                 
                 uploaded_files[file_type] = {
                     "filename": filename,
-                    "rows": len(df),
-                    "columns": list(df.columns)
+                    "rows": rows,
+                    "columns": list(header_df.columns)
                 }
                 
-                logger.info(f"Successfully uploaded {file_type} file with {len(df)} rows")
+                logger.info(f"Successfully uploaded {file_type} file with {rows} rows")
                 
             except Exception as e:
                 logger.error(f"Error processing {file_type} file: {str(e)}")
                 return jsonify({"error": f"Error processing {file_type} file: {str(e)}"}), 400
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
         
         if not uploaded_files:
             return jsonify({"error": "No valid files uploaded"}), 400
@@ -0,0 +1,115 @@
+"""
+Cached data file loading shared by the forecasting and optimization utilities.
+Files are parsed once and re-read only when their modification time or size changes.
+"""
+
+import os
+import logging
+from functools import lru_cache
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    from pyarrow import parquet as pq
+except ImportError:  # pyarrow is optional; pandas' C parser is used without it
+    pa_csv = pq = None
+
+logger = logging.getLogger(__name__)
+
+def _parse_csv(path):
+    """Parse a CSV file with pyarrow's multi-threaded reader when available."""
+    if pa_csv is not None:
+        try:
+            # Empty strings become missing values, as with pandas' C parser, and dates
+            # parse straight to timestamps rather than Python date objects
+            convert_options = pa_csv.ConvertOptions(
+                strings_can_be_null=True,
+                column_types={'date': pa.timestamp('ns')}
+            )
+            return pa_csv.read_csv(path, convert_options=convert_options).to_pandas()
+        except Exception as e:
+            logger.warning(f"pyarrow could not parse {path}, falling back to pandas: {str(e)}")
+    return pd.read_csv(path)
+
+def file_version(path):
+    """Return a key identifying the current version of a file on disk."""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+# Parquet schema metadata key recording the version of the CSV a mirror was built from
+MIRROR_SOURCE_KEY = b'demandiq.source_version'
+
+def _encode_version(version):
+    return '{}:{}'.format(*version).encode()
+
+def parquet_mirror_path(path):
+    """Location of the Parquet copy kept next to a CSV file."""
+    return os.path.splitext(path)[0] + '.parquet'
+
+def _read_parquet_mirror(path, columns):
+    """Read the Parquet mirror of a CSV file, or return None if it is missing or stale."""
+    mirror_path = parquet_mirror_path(path)
+    try:
+        source_version = _encode_version(file_version(path))
+        mirror = pq.ParquetFile(mirror_path, memory_map=True)
+        if (mirror.schema_arrow.metadata or {}).get(MIRROR_SOURCE_KEY) != source_version:
+            return None
+        return mirror.read(columns=columns).to_pandas()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Could not read Parquet mirror {mirror_path}: {str(e)}")
+        return None
+
+def _write_parquet_mirror(path, version, df):
+    """Write df as the Parquet mirror of a CSV file, tagged with the CSV's version."""
+    mirror_path = parquet_mirror_path(path)
+    temp_path = f"{mirror_path}.{os.getpid()}.tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[MIRROR_SOURCE_KEY] = _encode_version(version)
+        pq.write_table(table.replace_schema_metadata(metadata), temp_path, compression='zstd')
+        os.replace(temp_path, mirror_path)
+    except Exception as e:
+        logger.warning(f"Could not write Parquet mirror {mirror_path}: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def read_csv(path, columns=None):
+    """Load a CSV file, from its Parquet mirror when one is up to date.
+
+    After a CSV parse a zstd-compressed Parquet copy is written next to the file, so later
+    loads (including in other worker processes) read only the requested columns from
+    memory-mapped columnar data instead of parsing text again.
+    """
+    if pq is not None:
+        df = _read_parquet_mirror(path, columns)
+        if df is not None:
+            return df
+    
+    version = file_version(path)
+    df = _parse_csv(path)
+    if pq is not None:
+        _write_parquet_mirror(path, version, df)
+    return df[columns] if columns is not None else df
+
+@lru_cache(maxsize=4)
+def _product_lookup_cached(path, version):
+    products_df = read_csv(path)
+    products_df = products_df.drop_duplicates('product_id').set_index('product_id', drop=False)
+    return products_df.to_dict('index')
+
+def load_product_lookup(path='data/products.csv'):
+    """Product rows as dicts keyed by product ID; the first row wins for duplicate IDs."""
+    return _product_lookup_cached(path, file_version(path))
+
+@lru_cache(maxsize=4)
+def _historical_averages_cached(path, version):
+    sales_df = read_csv(path, columns=['product_id', 'quantity_sold'])
+    return sales_df.groupby('product_id')['quantity_sold'].mean().to_dict()
+
+def load_historical_averages(path='data/sales.csv'):
+    """Average quantity sold per product, recomputed only when the sales file changes."""
+    return _historical_averages_cached(path, file_version(path))
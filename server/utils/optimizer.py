@@ -3,82 +3,66 @@ Stock planning optimization considering shelf life constraints.
 Implements intelligent stock distribution to minimize waste while ensuring adequate supply.
 """
 import os
-import pandas as pd
+import threading
+import time
 import numpy as np
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import partial
 import logging
 from utils.forecast import DemandForecaster
+from utils.data_loader import file_version, load_product_lookup
 
 logger = logging.getLogger(__name__)
 
+# Plans with fewer products than this run inline. Per-product work mostly holds the GIL,
+# so threads only pay off for large plans on multi-core hosts
+PARALLEL_PLAN_THRESHOLD = 1000
+
+# Recent forecasts are reused for repeated plan requests (e.g. dashboard refreshes)
+PREDICTION_CACHE_TTL = 60  # seconds
+PREDICTION_CACHE_SIZE = 32
+
+_prediction_cache = OrderedDict()
+_prediction_cache_lock = threading.Lock()
+
 class StockOptimizer:
     """Optimizes stock planning with shelf life awareness and waste minimization."""
     
     def __init__(self):
         self.forecaster = DemandForecaster()
     
-    def optimize_stock_plan(self, product_ids=None, planning_horizon=7):
-        """Create optimized stock plan considering shelf life constraints."""
+    def optimize_stock_plan(self, product_ids=None, planning_horizon=7, include_recommendations=True):
+        """Create optimized stock plan considering shelf life constraints.
+        
+        With include_recommendations=False only the numeric plan is built; entries carry
+        no recommendations or cost analysis.
+        """
         try:
             # If no product_ids provided, get all products
             if product_ids is None:
                 if not os.path.exists('data/products.csv'):
                     raise FileNotFoundError("Products data not found")
-                products_df = pd.read_csv('data/products.csv')
-                product_ids = products_df['product_id'].unique().tolist()[:10]  # Limit to first 10 for demo
+                product_ids = list(load_product_lookup('data/products.csv'))[:10]  # Limit to first 10 for demo
             
             # Get demand predictions
             logger.info(f"Getting demand predictions for {len(product_ids)} products...")
-            predictions = self.forecaster.predict_demand(product_ids, planning_horizon)
+            predictions = self._predict_demand(product_ids, planning_horizon)
             
             # Load product information
-            products_df = pd.read_csv('data/products.csv')
+            product_lookup = load_product_lookup('data/products.csv')
             
-            stock_plan = []
-            
-            for product_id in product_ids:
-                if product_id not in predictions:
-                    logger.warning(f"No predictions available for product {product_id}")
-                    continue
-                
-                product_info = products_df[products_df['product_id'] == product_id]
-                if product_info.empty:
-                    logger.warning(f"Product {product_id} not found in products data")
-                    continue
-                    
-                product_info = product_info.iloc[0]
-                shelf_life = product_info.get('shelf_life_days', 7)  # Default 7 days
-                daily_forecast = predictions[product_id]['daily_forecast']
-                total_forecast = predictions[product_id]['total_forecast']
-                
-                # Optimize stock distribution
-                optimized_plan = self._optimize_single_product(
-                    daily_forecast, shelf_life, planning_horizon, product_id
-                )
-                
-                # Calculate stock status
-                stock_status = self._determine_stock_status(
-                    optimized_plan['total_stock'], total_forecast, shelf_life
-                )
-                
-                # Generate recommendations
-                recommendations = self._generate_recommendations(
-                    optimized_plan, stock_status, shelf_life, product_info
-                )
-                
-                stock_plan.append({
-                    'product_id': product_id,
-                    'product_name': product_info.get('product_name', f'Product {product_id}'),
-                    'shelf_life_days': int(shelf_life),
-                    'predicted_demand': round(total_forecast, 2),
-                    'recommended_stock': optimized_plan['total_stock'],
-                    'daily_stock_plan': optimized_plan['daily_stock'],
-                    'stock_status': stock_status,
-                    'wastage_risk': optimized_plan['wastage_risk'],
-                    'service_level': optimized_plan['service_level'],
-                    'recommendations': recommendations,
-                    'cost_analysis': self._calculate_costs(optimized_plan, product_info)
-                })
+            # Products are planned independently; map keeps the requested order
+            plan_one = partial(self._plan_one, predictions=predictions, product_lookup=product_lookup,
+                               planning_horizon=planning_horizon, include_recommendations=include_recommendations)
+            max_workers = min(8, os.cpu_count() or 1)
+            if max_workers > 1 and len(product_ids) >= PARALLEL_PLAN_THRESHOLD:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    rows = list(executor.map(plan_one, product_ids))
+            else:
+                rows = [plan_one(product_id) for product_id in product_ids]
+            stock_plan = [row for row in rows if row is not None]
             
             return {
                 'stock_plan': stock_plan,
@@ -91,11 +75,87 @@ class StockOptimizer:
             logger.error(f"Stock optimization failed: {str(e)}")
             raise e
     
+    def _predict_demand(self, product_ids, planning_horizon):
+        """Forecast demand, reusing a result computed for the same request within the TTL."""
+        try:
+            # Forecasts depend on the model and data files as well as on today's date
+            paths = (self.forecaster.model_path, self.forecaster.booster_path,
+                     'data/sales.csv', 'data/products.csv')
+            versions = tuple(file_version(path) if os.path.exists(path) else None for path in paths)
+            key = (frozenset(product_ids), planning_horizon, date.today(), versions)
+            hash(key)
+        except TypeError:
+            # Unhashable product IDs are left for predict_demand to handle
+            return self.forecaster.predict_demand(product_ids, planning_horizon)
+        
+        now = time.monotonic()
+        with _prediction_cache_lock:
+            entry = _prediction_cache.get(key)
+            if entry is not None and now - entry[0] < PREDICTION_CACHE_TTL:
+                logger.info("Reusing cached demand predictions")
+                return entry[1]
+        
+        predictions = self.forecaster.predict_demand(product_ids, planning_horizon)
+        
+        with _prediction_cache_lock:
+            _prediction_cache[key] = (now, predictions)
+            _prediction_cache.move_to_end(key)
+            while len(_prediction_cache) > PREDICTION_CACHE_SIZE:
+                _prediction_cache.popitem(last=False)
+        return predictions
+    
+    def _plan_one(self, product_id, predictions, product_lookup, planning_horizon, include_recommendations=True):
+        """Build the stock plan entry for one product, or None if it cannot be planned."""
+        if product_id not in predictions:
+            logger.warning(f"No predictions available for product {product_id}")
+            return None
+        
+        product_info = product_lookup.get(product_id)
+        if product_info is None:
+            logger.warning(f"Product {product_id} not found in products data")
+            return None
+            
+        shelf_life = product_info.get('shelf_life_days', 7)  # Default 7 days
+        daily_forecast = predictions[product_id]['daily_forecast']
+        total_forecast = predictions[product_id]['total_forecast']
+        
+        # Optimize stock distribution
+        optimized_plan = self._optimize_single_product(
+            daily_forecast, shelf_life, planning_horizon, product_id
+        )
+        
+        # Calculate stock status
+        stock_status = self._determine_stock_status(
+            optimized_plan['total_stock'], total_forecast, shelf_life
+        )
+        
+        entry = {
+            'product_id': product_id,
+            'product_name': product_info.get('product_name', f'Product {product_id}'),
+            'shelf_life_days': int(shelf_life),
+            'predicted_demand': round(total_forecast, 2),
+            'recommended_stock': optimized_plan['total_stock'],
+            'daily_stock_plan': optimized_plan['daily_stock'],
+            'stock_status': stock_status,
+            'wastage_risk': round(optimized_plan['wastage_risk'], 2),
+            'service_level': optimized_plan['service_level']
+        }
+        
+        if include_recommendations:
+            # Generate recommendations
+            entry['recommendations'] = self._generate_recommendations(
+                optimized_plan, stock_status, shelf_life, product_info
+            )
+            entry['cost_analysis'] = self._calculate_costs(optimized_plan, product_info)
+        
+        return entry
+    
     def _optimize_single_product(self, daily_forecast, shelf_life, horizon, product_id):
         """Optimize stock for a single product considering shelf life."""
-        n_days = min(horizon, len(daily_forecast))
+        daily_forecast = np.asarray(daily_forecast, dtype=np.float64)
+        n_days = min(horizon, daily_forecast.size)
         
-        if n_days == 0 or not daily_forecast:
+        if n_days == 0:
             return {
                 'daily_stock': [0.0] * max(1, n_days),
                 'total_stock': 0.0,
@@ -103,41 +163,30 @@ class StockOptimizer:
                 'service_level': 0.0
             }
         
-        # Calculate safety stock based on demand variability
-        avg_demand = sum(daily_forecast) / len(daily_forecast)
-        demand_std = np.std(daily_forecast) if len(daily_forecast) > 1 else avg_demand * 0.2
+        # Calculate safety stock based on demand variability. Scalars are kept as Python
+        # floats; NumPy scalar arithmetic costs more than the arrays here are long. Sums run
+        # left to right over the list, as NumPy's pairwise sum can differ in the last bit
+        forecast_values = daily_forecast.tolist()
+        total_demand = sum(forecast_values)
+        avg_demand = total_demand / len(forecast_values)
+        demand_std = float(daily_forecast.std()) if daily_forecast.size > 1 else avg_demand * 0.2
         safety_stock_factor = min(0.5, demand_std / max(avg_demand, 1))  # Cap at 50%
         
+        # Add safety stock (more for shorter shelf life products)
+        shelf_life_factor = max(0.1, min(1.0, shelf_life / 30))  # Scale based on shelf life
+        
         # Strategy: Balance service level with waste minimization
-        daily_stock = []
-        total_demand = sum(daily_forecast)
+        day_demand = daily_forecast[:n_days]
+        safety_stock = day_demand * safety_stock_factor * shelf_life_factor
         
-        for day in range(n_days):
-            day_demand = daily_forecast[day] if day < len(daily_forecast) else avg_demand
-            
-            # Base stock calculation
-            base_stock = day_demand
-            
-            # Add safety stock (more for shorter shelf life products)
-            shelf_life_factor = max(0.1, min(1.0, shelf_life / 30))  # Scale based on shelf life
-            safety_stock = base_stock * safety_stock_factor * shelf_life_factor
-            
-            # Adjust for weekend/weekday patterns
-            if day < len(daily_forecast):
-                # If this is a high-demand day, increase stock slightly
-                if day_demand > avg_demand * 1.2:
-                    base_stock *= 1.1
-                elif day_demand < avg_demand * 0.8:
-                    base_stock *= 0.9
-            
-            recommended_stock = base_stock + safety_stock
-            daily_stock.append(max(0, round(recommended_stock, 2)))
+        # Adjust for weekend/weekday patterns: stock up on high-demand days, trim slow ones
+        adjustment = np.where(day_demand > avg_demand * 1.2, 1.1,
+                              np.where(day_demand < avg_demand * 0.8, 0.9, 1.0))
+        # Round with Python's round(): np.round is not correctly rounded at half-cent ties
+        daily_stock = [max(0, round(stock, 2)) for stock in (day_demand * adjustment + safety_stock).tolist()]
         
         total_stock = sum(daily_stock)
         
-        # Calculate wastage risk based on shelf life vs planning horizon
-        wastage_risk = self._calculate_wastage_risk(daily_stock, daily_forecast, shelf_life)
-        
         # Calculate service level (ability to meet demand)
         service_level = min(100, (total_stock / max(total_demand, 1)) * 100)
         
@@ -147,7 +196,9 @@ class StockOptimizer:
             daily_stock = [stock * adjustment_factor for stock in daily_stock]
             total_stock = sum(daily_stock)
             service_level = min(100, (total_stock / max(total_demand, 1)) * 100)
-            wastage_risk = self._calculate_wastage_risk(daily_stock, daily_forecast, shelf_life)
+        
+        # Calculate wastage risk based on shelf life vs planning horizon, once for the final plan
+        wastage_risk = self._calculate_wastage_risk(total_stock, total_demand, n_days, shelf_life)
         
         return {
             'daily_stock': [round(stock, 2) for stock in daily_stock],
@@ -156,14 +207,8 @@ class StockOptimizer:
             'service_level': round(service_level, 2)
         }
     
-    def _calculate_wastage_risk(self, daily_stock, daily_forecast, shelf_life):
-        """Calculate the risk of product wastage based on shelf life and demand."""
-        if not daily_stock or not daily_forecast:
-            return 0.0
-        
-        total_stock = sum(daily_stock)
-        total_demand = sum(daily_forecast)
-        
+    def _calculate_wastage_risk(self, total_stock, total_demand, horizon_days, shelf_life):
+        """Calculate the risk of product wastage based on shelf life and demand totals."""
         if total_demand == 0:
             return 1.0 if total_stock > 0 else 0.0
         
@@ -174,7 +219,6 @@ class StockOptimizer:
         shelf_life_risk = max(0, (14 - shelf_life) / 14)  # Risk increases as shelf life decreases from 14 days
         
         # Planning horizon factor: longer planning vs shelf life = higher risk
-        horizon_days = len(daily_stock)
         horizon_risk = max(0, (horizon_days - shelf_life) / max(horizon_days, 1))
         
         # Combined wastage risk (weighted average)
@@ -212,13 +256,13 @@ class StockOptimizer:
         recommendations = []
         
         if stock_status == 'overstock':
-            recommendations.append(f"Consider reducing order quantity by {max(5, int((optimized_plan['total_stock'] - sum([30] * len(optimized_plan['daily_stock']))) / 2))} units")
+            recommendations.append(f"Consider reducing order quantity by {max(5, int((optimized_plan['total_stock'] - 30 * len(optimized_plan['daily_stock'])) / 2))} units")
             if shelf_life <= 7:
                 recommendations.append("Monitor closely for spoilage due to short shelf life")
             recommendations.append("Consider promotional pricing to move excess inventory")
             
         elif stock_status == 'understock':
-            deficit = max(10, int(sum([30] * len(optimized_plan['daily_stock'])) - optimized_plan['total_stock']))
+            deficit = max(10, int(30 * len(optimized_plan['daily_stock']) - optimized_plan['total_stock']))
             recommendations.append(f"Increase order quantity by approximately {deficit} units")
             recommendations.append("Monitor sales closely to avoid stockouts")
             
@@ -267,10 +311,13 @@ class StockOptimizer:
         if not stock_plan:
             return {}
         
-        total_stock = sum(item['recommended_stock'] for item in stock_plan)
-        total_demand = sum(item['predicted_demand'] for item in stock_plan)
-        avg_service_level = sum(item['service_level'] for item in stock_plan) / len(stock_plan)
-        avg_wastage_risk = sum(item['wastage_risk'] for item in stock_plan) / len(stock_plan)
+        # Gather the aggregated metrics in one pass, then total/average them column-wise
+        metrics = np.array([
+            (item['recommended_stock'], item['predicted_demand'], item['service_level'], item['wastage_risk'])
+            for item in stock_plan
+        ], dtype=np.float64)
+        total_stock, total_demand = metrics[:, :2].sum(axis=0).tolist()
+        avg_service_level, avg_wastage_risk = metrics[:, 2:].mean(axis=0).tolist()
         
         status_counts = {}
         for item in stock_plan:
@@ -281,7 +328,7 @@ class StockOptimizer:
             'total_recommended_stock': round(total_stock, 2),
             'total_predicted_demand': round(total_demand, 2),
             'overall_service_level': round(avg_service_level, 2),
-            'average_wastage_risk': round(avg_wastage_risk, 3),
+            'average_wastage_risk': round(avg_wastage_risk, 2),
             'stock_status_distribution': status_counts,
             'optimization_date': datetime.now().isoformat()
         }
\ No newline at end of file
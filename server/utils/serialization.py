@@ -0,0 +1,39 @@
+"""
+JSON serialization helpers built on orjson.
+Shared by the Flask JSON provider and routes returning NumPy-heavy payloads.
+"""
+
+from flask import current_app
+from flask.json.provider import JSONProvider
+import numpy as np
+import orjson
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def json_default(obj):
+    """Fallback hook for values orjson does not encode natively."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+def json_dumps(obj):
+    """Serialize obj to JSON bytes, encoding NumPy values natively."""
+    return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+
+def to_json_response(payload):
+    """Serialize payload once and wrap the bytes in a JSON response."""
+    return current_app.response_class(json_dumps(payload), mimetype='application/json')
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, so jsonify() shares the same encoding."""
+    
+    def dumps(self, obj, **kwargs):
+        return json_dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand the encoded bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_dumps(obj), mimetype='application/json')
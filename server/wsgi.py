@@ -0,0 +1,10 @@
+"""
+WSGI entry point for serving the API with a production server.
+Run from the server directory so the relative data/ and models/ paths resolve:
+
+    gunicorn -w $(nproc) -k gthread --threads 4 --preload wsgi:app
+"""
+
+from app import create_app
+
+app = create_app()